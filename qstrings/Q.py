@@ -2,13 +2,16 @@ import duckdb
 import json
 import pathlib
 import os
+import re
 import sqlglot
 import string
+import time
 
 from abc import abstractmethod
 from autoregistry import Registry
-from datetime import datetime
-from io import StringIO
+from collections import ChainMap
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
 from typing import Any, Dict, Literal, Self, Union, overload
 
 from .config import log
@@ -16,15 +19,51 @@ from .config import log
 PathType = Union[pathlib.Path, Any]
 StrPath = Union[str, os.PathLike[str], None]
 
+_FMT = string.Formatter()
+_last_id = 0
 
-def parse_keys(s: str) -> set[str]:
+
+def _next_id() -> int:
+    """Wall-clock nanoseconds, bumped if needed to stay strictly increasing."""
+    global _last_id
+    _last_id = max(time.time_ns(), _last_id + 1)
+    return _last_id
+
+
+@lru_cache(maxsize=256)
+def _cached_parse(
+    s: str,
+) -> tuple[sqlglot.expressions.Expression | None, sqlglot.errors.ParseError | None]:
+    """Parse SQL once per distinct string; returns (ast, error).
+
+    The cached AST is shared, so callers must `.copy()` it before use;
+    the cached error is re-raised as a fresh copy (see `_raise_parse_error`).
+    Reset with `_cached_parse.cache_clear()`.
+    """
+    try:
+        return sqlglot.parse_one(s), None
+    except sqlglot.errors.ParseError as e:
+        return None, e.with_traceback(None)  # don't pin the parser's frames
+
+
+def _raise_parse_error(e: sqlglot.errors.ParseError):
+    """Raise a copy of a cached ParseError, keeping its line/col details."""
+    raise type(e)(str(e), errors=[dict(err) for err in e.errors])
+
+
+@lru_cache(maxsize=128)
+def _cached_transpile(sql: str, read: str, write: str) -> str:
+    """Transpile SQL once per distinct (sql, read, write)."""
+    return sqlglot.transpile(sql, read=read, write=write)[0]
+
+
+@lru_cache(maxsize=1024)
+def parse_keys(s: str) -> frozenset[str]:
     """Return a set of keys from a string formatted with {}."""
-    formatter = string.Formatter()
-    keys = set()
-    for _, fname, _, _ in formatter.parse(s):
-        if fname:
-            keys.add(fname)
-    return keys
+    if "{" not in s and "}" not in s:
+        return frozenset()
+    # Formatter.parse is backed by the C scanner in the _string module
+    return frozenset(fname for _, fname, _, _ in _FMT.parse(s) if fname)
 
 
 class BaseQ(str):
@@ -57,30 +96,27 @@ class BaseQ(str):
             with _path.open("r") as f:
                 s = f.read()
 
-        kwargs_plus_env = dict(**kwargs, **os.environ)
+        kwargs_plus_env = ChainMap(kwargs, os.environ)  # lookups only, no copy
         keys_needed = parse_keys(s)
-        keys_given = set(kwargs_plus_env)
-        keys_missing = keys_needed - keys_given
+        keys_missing = {k for k in keys_needed if k not in kwargs_plus_env}
         if keys_missing:
             raise QStringError(f"values missing for keys: {keys_missing}")
         refs = {k: kwargs_plus_env[k] for k in keys_needed}
-        s_formatted = s.format(**refs)
+        if keys_needed or "{" in s or "}" in s:
+            s_formatted = s.format_map(refs)
+        else:
+            s_formatted = s  # nothing to substitute or unescape
 
         qstr = str.__new__(cls, s_formatted)
-        qstr.id = int(f"{datetime.now():%y%m%d%H%M%S%f}")
+        qstr.id = _next_id()
         qstr.template = s
         qstr.refs = refs  # references used to create the Q string
         qstr.file = _path if file else None
         qstr.alias = kwargs.get("alias")
 
-        try:
-            qstr.ast = sqlglot.parse_one(s_formatted)
-            qstr.ast_errors = None
-        except sqlglot.errors.ParseError as e:
-            if kwargs.get("validate"):
-                raise e
-            qstr.ast = None
-            qstr.ast_errors = str(e)
+        # ast and ast_errors are parsed lazily, unless validating now
+        if kwargs.get("validate") and (error := _cached_parse(s_formatted)[1]):
+            _raise_parse_error(error)
 
         qstr.exec_id = 0
         qstr.duration = 0.0
@@ -91,11 +127,24 @@ class BaseQ(str):
         qstr._quiet = kwargs.get("quiet", False)
         return qstr
 
+    @cached_property
+    def ast(self) -> sqlglot.expressions.Expression | None:
+        """sqlglot AST, parsed on first access; None if the SQL is invalid."""
+        ast, error = _cached_parse(str(self))
+        self.ast_errors = str(error) if error else None
+        return ast.copy() if ast else None
+
+    @cached_property
+    def ast_errors(self) -> str | None:
+        """sqlglot parse errors, or None if the SQL is valid."""
+        error = _cached_parse(str(self))[1]
+        return str(error) if error else None
+
     def transpile(self, read: str = "duckdb", write: str = "tsql") -> Self:
         """Transpile the SQL to a different dialect using sqlglot."""
         if not self.ast:
             raise QStringError("Cannot transpile invalid SQL")
-        return BaseQ(sqlglot.transpile(self.ast.sql(), read=read, write=write)[0])
+        return BaseQ(_cached_transpile(self.ast.sql(), read, write))
 
     def limit(self, n: int = 5) -> Self:
         return sqlglot.subquery(self.ast).select("*").limit(n).q()
@@ -106,10 +155,10 @@ class BaseQ(str):
 
     @property
     def dict(self) -> Dict[str, Any]:
-        d = {}
+        # ast_errors stays NULL unless the AST was already parsed
+        d = {"qstr": str(self), "ast_errors": self.__dict__.get("ast_errors")}
         for k, v in self.__dict__.items():
-            if k == "ast":
-                d["qstr"] = str(self)
+            if k in d or k == "ast":
                 continue
             if not k.startswith("_"):
                 if isinstance(v, (int, float)) or v is None:
@@ -137,7 +186,8 @@ class BaseQ(str):
     @classmethod
     def from_history(cls, exec_id: int | None = None, alias: str | None = "") -> Self:
         """Retrieve most recent Q string from history matching exec_id or alias."""
-        with duckdb.connect(cls.HISTORY) as con:
+        # pooled, so a read-only history connection can't lock us out
+        with DuckDBEngine.connect(cls.HISTORY).cursor() as con:
             if exec_id is None and alias == "":
                 # no exec_id or alias - load all, return most recent
                 where_ = ""
@@ -177,53 +227,66 @@ class Q(BaseQ):
 
     def run(self, engine=None, **kwargs):
         """Run with chosen Engine."""
-        engine = engine or "duckdb"
-        cls = Engine[engine]
-        self._engine_cls = cls.__name__
-        return cls.run(self, **kwargs)
+        return self._engine(engine).run(self, **kwargs)
 
     def list(self, engine=None, **kwargs):
         """Return the result as a list."""
-        engine = engine or "duckdb"
-        cls = Engine[engine]
-        self._engine_cls = cls.__name__
-        return cls.list(self, **kwargs)
+        return self._engine(engine).list(self, **kwargs)
+
+    def iter_rows(self, engine=None, **kwargs):
+        """Iterate over the result rows (in batches, where the engine can)."""
+        return self._engine(engine).iter_rows(self, **kwargs)
 
     def df(self, engine=None, **kwargs):
         """Return the result as a DataFrame."""
-        engine = engine or "duckdb"
-        return Engine[engine].df(self, **kwargs)
+        return self._engine(engine).df(self, **kwargs)
+
+    def _engine(self, engine: str | None) -> type["Engine"]:
+        """Look up the Engine class (default: duckdb) and record its name."""
+        key = engine or _DEFAULT_ENGINE
+        cls = _ENGINE_CACHE.get(key)
+        if cls is None:
+            cls = _ENGINE_CACHE[key] = Engine[key]
+        self._engine_cls = cls.__name__
+        return cls
 
     def save(self) -> None:
         """Save Q string execution to history."""
         if not self.HISTORY:
             return
-        with duckdb.connect(self.HISTORY) as con:
-            last_q = con.read_json(
-                StringIO(self.json()),
-                # must spell out types or NULLs forced to JSON
-                columns={
-                    "id": "BIGINT",
-                    "template": "VARCHAR",
-                    "refs": "VARCHAR",
-                    "file": "VARCHAR",
-                    "alias": "VARCHAR",
-                    "qstr": "VARCHAR",
-                    "ast_errors": "VARCHAR",
-                    "exec_id": "BIGINT",
-                    "duration": "DOUBLE",
-                    "rows": "INT",
-                    "cols": "INT",
-                    "input_tokens": "INT",
-                    "output_tokens": "INT",
-                },
+        columns = {
+            "id": "BIGINT",
+            "template": "VARCHAR",
+            "refs": "VARCHAR",
+            "file": "VARCHAR",
+            "alias": "VARCHAR",
+            "qstr": "VARCHAR",
+            "ast_errors": "VARCHAR",
+            "exec_id": "BIGINT",
+            "duration": "DOUBLE",
+            "rows": "INT",
+            "cols": "INT",
+            "input_tokens": "INT",
+            "output_tokens": "INT",
+        }
+        d = self.dict
+        names = ", ".join(f'"{k}"' for k in columns)
+        params = ", ".join("?" for _ in columns)
+        # pooled, so a read-only history connection can't lock us out
+        with DuckDBEngine.connect(self.HISTORY).cursor() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS q ("
+                + ", ".join(f'"{k}" {t}' for k, t in columns.items())
+                + ")"
             )
-            con.register("last_q", last_q)
-            has_tables = any("q" in t for t in con.sql("SHOW TABLES").fetchall())
-            if not has_tables:
-                con.sql("CREATE TABLE IF NOT EXISTS q AS FROM last_q")
-            else:
-                con.sql("INSERT INTO q FROM last_q")
+            con.execute(
+                f"INSERT INTO q ({names}) VALUES ({params})",
+                [d.get(k) for k in columns],
+            )
+
+
+_DEFAULT_ENGINE = "duckdb"
+_ENGINE_CACHE: dict[str, type["Engine"]] = {}  # name -> class, skips Engine[name]
 
 
 class Engine(Registry, suffix="Engine", overwrite=True):
@@ -235,6 +298,10 @@ class Engine(Registry, suffix="Engine", overwrite=True):
     https://github.com/BrianPugh/autoregistry
     """
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        _ENGINE_CACHE.clear()  # new or redefined engine
+
     @abstractmethod
     def run(q: Q):
         raise NotImplementedError
@@ -247,31 +314,37 @@ class Engine(Registry, suffix="Engine", overwrite=True):
     def df(q: Q):
         raise NotImplementedError
 
+    @classmethod
+    def iter_rows(cls, q: Q, **kwargs):
+        """Yield result rows; engines that can stream should override this."""
+        yield from cls.list(q, **kwargs)
+
     def timer_logger(func):
         def logging_wrapper(self, *args, **kwargs):
-            quiet = getattr(self, "_quiet", False) or kwargs.get("quiet", False)
-            self.exec_id = int(f"{datetime.now():%y%m%d%H%M%S%f}")
+            # consumed here, not passed on to the engine
+            quiet = kwargs.pop("quiet", False) or self._quiet
+            save = kwargs.pop("save", True)
+            self.exec_id = _next_id()
+            t0 = time.perf_counter_ns()
             try:
                 result = func(self, *args, **kwargs)
             except Exception as e:
                 if not quiet:
                     log.error(f"Error: {e}")
                 raise e
-            t_done = int(f"{datetime.now():%y%m%d%H%M%S%f}")
-            self.duration = round((t_done - self.exec_id) / 1e6, 4)
-
-            if self.rows + self.cols > 0:
-                _stats = f"{self.rows} rows x {self.cols} cols"
-            elif self.input_tokens + self.output_tokens > 0:
-                _it, _ot = self.input_tokens, self.output_tokens
-                _stats = f"{_it} input x {_ot} output tokens"
-            else:
-                _stats = "no results"
-            msg = f"{self._engine_cls}: {_stats} in {self.duration:.4f} sec"
+            self.duration = round((time.perf_counter_ns() - t0) / 1e9, 4)
+
             if not quiet:
-                log.info(msg)
+                if self.rows + self.cols > 0:
+                    _stats = f"{self.rows} rows x {self.cols} cols"
+                elif self.input_tokens + self.output_tokens > 0:
+                    _it, _ot = self.input_tokens, self.output_tokens
+                    _stats = f"{_it} input x {_ot} output tokens"
+                else:
+                    _stats = "no results"
+                log.info(f"{self._engine_cls}: {_stats} in {self.duration:.4f} sec")
 
-            if kwargs.get("save", True):
+            if save:
                 # log.debug(f"saving to history: {self}")
                 self.save()
 
@@ -280,23 +353,121 @@ class Engine(Registry, suffix="Engine", overwrite=True):
         return logging_wrapper
 
 
+@dataclass
+class ErrorRelation:
+    """Minimal stand-in for a DuckDB relation holding a failed query and error."""
+
+    q: str
+    error: str
+    # set once fetchmany has returned the row, like an open DuckDB result
+    _consumed: bool = field(default=False, init=False, repr=False)
+
+    columns = ("q", "r")
+    shape = (1, 2)
+
+    def __str__(self) -> str:
+        return f"q: {self.q}\nr: {self.error}"
+
+    def _rows(self) -> list[tuple[str, str]]:
+        return [(self.q, self.error)]
+
+    def fetchall(self) -> list[tuple[str, str]]:
+        """Remaining rows; closes the result, so the next fetch starts over."""
+        if self._consumed:
+            self._consumed = False
+            return []
+        return self._rows()
+
+    def fetchmany(self, size: int = 1) -> list[tuple[str, str]]:
+        if self._consumed:
+            return []
+        self._consumed = True
+        return self._rows()
+
+    def df(self):
+        import pandas as pd
+
+        return pd.DataFrame(self._rows(), columns=self.columns)
+
+    def to_csv(self, file_name: str) -> None:
+        import csv
+
+        with open(file_name, "w", newline="") as f:
+            csv.writer(f).writerows([self.columns, *self._rows()])
+
+
 class DuckDBEngine(Engine):
-    """DuckDB engine.  By default runs using in-memory database."""
+    """DuckDB engine.  By default runs using in-memory database.
+
+    Connections are pooled per database and reused across runs, so state
+    persists: tables created in the in-memory database in one run are
+    visible in the next.  Use `DuckDBEngine.close()` to reset.
+    """
 
     con: duckdb.DuckDBPyConnection = None
+    # database -> (read_only, connection), reused across runs
+    _con_pool: dict[str, tuple[bool, duckdb.DuckDBPyConnection]] = {}
+
+    @staticmethod
+    def _pool_key(db: StrPath) -> str:
+        """In-memory and URI-style databases as given, local files resolved."""
+        db = str(db or ":memory:")
+        if db.startswith(":memory:") or re.match(r"[a-zA-Z][\w+.-]+:", db):
+            return db  # e.g. md:my_db, not C:\my.duckdb
+        return str(pathlib.Path(db).resolve())
+
+    @staticmethod
+    def connect(
+        db: StrPath = "", read_only: bool = False
+    ) -> duckdb.DuckDBPyConnection:
+        """Return the pooled connection for `db`, connecting on first use.
+
+        DuckDB allows one configuration per file, so a pooled read-write
+        connection also serves read-only requests, while a pooled read-only
+        connection is closed and replaced when writing.
+        """
+        key = DuckDBEngine._pool_key(db)
+        pooled = DuckDBEngine._con_pool.get(key)
+        if pooled and (pooled[0] == read_only or read_only):
+            return pooled[1]
+        if pooled:
+            DuckDBEngine.close(key)
+        con = duckdb.connect(database=key, read_only=read_only)
+        DuckDBEngine._con_pool[key] = (read_only, con)
+        return con
+
+    @staticmethod
+    def close(db: StrPath = None) -> None:
+        """Close the pooled connection for `db`, or all of them if not given."""
+        if db is None:
+            keys = list(DuckDBEngine._con_pool)
+        else:
+            keys = [DuckDBEngine._pool_key(db)]
+        for key in keys:
+            _, con = DuckDBEngine._con_pool.pop(key, (None, None))
+            if con is not None:
+                con.close()
+                if DuckDBEngine.con is con:
+                    DuckDBEngine.con = None
 
     @Engine.timer_logger
-    def run(q: Q, db: StrPath = "", **kwargs) -> duckdb.DuckDBPyRelation:
+    def run(
+        q: Q, db: StrPath = "", **kwargs
+    ) -> duckdb.DuckDBPyRelation | ErrorRelation:
         """Run with DuckDB."""
-        DuckDBEngine.con = duckdb.connect(
-            database=db, read_only=kwargs.get("read_only", False)
-        )
-        # connection to remain attached to something, otherwise closed and gc'd
+        # pooled connection stays attached to the class, otherwise closed and gc'd
+        read_only = kwargs.get("read_only", False)
+        if read_only and q.HISTORY and db:
+            # history is written after every run; read-only would lock that out
+            history = DuckDBEngine._pool_key(q.HISTORY)
+            read_only = DuckDBEngine._pool_key(db) != history
+        DuckDBEngine.con = DuckDBEngine.connect(db, read_only)
         try:
-            relation = DuckDBEngine.con.sql(q)
+            # cursors are cheap and share the parent's catalog and extensions
+            relation = DuckDBEngine.con.cursor().sql(q)
             q.rows, q.cols = relation.shape
         except Exception as e:
-            relation = duckdb.sql(f"SELECT '{q}' AS q, '{e}' AS r")
+            relation = ErrorRelation(str(q), str(e))
         return relation
 
     @staticmethod
@@ -309,6 +480,17 @@ class DuckDBEngine(Engine):
         result = ([tuple(rel.columns)] if header else []) + rel.fetchall()
         return result
 
+    @staticmethod
+    def iter_rows(
+        q: Q, db: StrPath = "", header=True, batch_size: int = 10_000, **kwargs
+    ):
+        """Yield result rows, fetching `batch_size` rows at a time."""
+        rel = DuckDBEngine.run(q, db, **kwargs)
+        if header:
+            yield tuple(rel.columns)
+        while batch := rel.fetchmany(batch_size):
+            yield from batch
+
 
 class AIEngine(Engine):
     """Base class for AI engines."""
@@ -324,21 +506,47 @@ class MockAIEngine(AIEngine):
 class HFEngine(AIEngine):
     """Hugging Face OpenAI-compatible inference API engine."""
 
+    # shared client keeps HTTP connections alive across runs
+    _client = None
+
+    @staticmethod
+    def client():
+        """Return the shared OpenAI client, creating it on first use."""
+        if HFEngine._client is None:
+            from openai import OpenAI
+
+            HFEngine._client = OpenAI(
+                base_url="https://router.huggingface.co/v1",
+                api_key=os.getenv("HF_API_KEY"),
+            )
+        return HFEngine._client
+
     @Engine.timer_logger
     def run(q: Q, model: str = "openai/gpt-oss-20b:fireworks-ai", **kwargs):
         """Run LLM query on HF.  Requires env var `HF_API_KEY`."""
-        from openai import OpenAI
-
-        client = OpenAI(
-            base_url="https://router.huggingface.co/v1", api_key=os.getenv("HF_API_KEY")
-        )
-        q._response = client.responses.create(model=model, input=q)
+        chunks = []  # output text arrives in deltas, joined once at the end
+        q._response = None  # don't report a previous run's response
+        client = HFEngine.client()
+        # context manager releases the pooled HTTP connection, also on errors
+        with client.responses.create(model=model, input=q, stream=True) as stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    chunks.append(event.delta)
+                elif event.type in ("response.completed", "response.incomplete"):
+                    q._response = event.response
+                elif event.type == "response.failed":
+                    error = event.response.error
+                    raise QStringError(f"HF response failed: {error}")
+                elif event.type == "error":
+                    raise QStringError(f"HF stream error: {event.message}")
+        if q._response is None:
+            raise QStringError("HF stream ended without a final response")
         q.input_tokens = q._response.usage.input_tokens
         q.output_tokens = q._response.usage.output_tokens
         # if not q._quiet and not kwargs.get("quiet"):
         #     log.debug(f"{q.input_tokens=}")
         #     log.debug(f"{q.output_tokens=}")
-        result = q._response.output[1].content[0].text
+        result = "".join(chunks)
         return result
 
     @staticmethod
@@ -356,4 +564,6 @@ def sqlglot_sql_q(ex: sqlglot.expressions.Expression, *args, **kwargs):
     return Q(ex.sql(*args, **kwargs))
 
 
-sqlglot.expressions.Expression.q = sqlglot_sql_q
+# skip reassigning on repeated execution; importlib.reload still rebinds
+if getattr(sqlglot.expressions.Expression, "q", None) is not sqlglot_sql_q:
+    sqlglot.expressions.Expression.q = sqlglot_sql_q
@@ -52,6 +52,9 @@ def run_query(
     quiet: Annotated[
         bool, Parameter(name=["-q", "--quiet"], help="Suppress logs")
     ] = False,
+    validate: Annotated[
+        bool, Parameter(name=["--validate"], help="Validate SQL with sqlglot")
+    ] = False,
     **kwargs,
 ):
     # log.debug(f"{query=} {file=} {engine=} {model=} {output_format=}")
@@ -73,7 +76,7 @@ def run_query(
             query = sys.stdin.read()
 
     query_with_newlines = query.replace(r"\n", "\n")
-    q = Q(query_with_newlines, file=file, quiet=quiet, **kwargs)
+    q = Q(query_with_newlines, file=file, quiet=quiet, validate=validate, **kwargs)
     if limit:
         q = q.limit(limit)
     if only_count:
@@ -13,7 +13,6 @@ config = {
     **dotenv_values(Path(__file__).parent.parent / ".env"),
     **os.environ,
 }
-print(config.get("QSTRINGS_HISTORY"))
 
 
 def read_pyproject() -> dict:
@@ -39,11 +38,14 @@ def get_version():
     return package_version
 
 
+_VERSION = get_version()  # resolved once, not per log record
+
+
 class VersionedFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         parts = record.name.split(".")
         if "[" not in parts[0]:
-            parts[0] += f"[{get_version()}]"
+            parts[0] += f"[{_VERSION}]"
         record.name = ".".join(parts)
         return super().format(record)
 
@@ -83,13 +85,9 @@ def setup_history(history_path: str | Path | None = None) -> Path:
             qstrings_env += f"?motherduck_token={_md_token}"
         return Path(qstrings_env)
 
-    pyproject = Path(__file__).parent.parent / "pyproject.toml"
-    if pyproject.exists():
-        with pyproject.open("rb") as f:
-            data = tomllib.load(f)
-        history = data.get("tool", {}).get("qstrings", {}).get("history")
-        if history:
-            return Path(history)
+    history = PYPROJECT.get("tool", {}).get("qstrings", {}).get("history")
+    if history:
+        return Path(history)
 
     # fallback to package-local file
     return Path(__file__).parent / "history.duckdb"
@@ -1,10 +1,14 @@
 import duckdb
 import os
 import pytest
+import subprocess
+import sys
 from pathlib import Path
+from types import SimpleNamespace
 from sqlglot.errors import ParseError
 
 from qstrings import config, Engine, Q, QStringError
+from qstrings.Q import parse_keys
 
 Q.HISTORY = config.setup_history(Path(__file__).parent / "test_history.duckdb")
 
@@ -16,6 +20,32 @@ def test_empty_string():
     assert q.ast_errors
 
 
+@pytest.mark.parametrize(
+    "s, keys",
+    [
+        ("SELECT 42", set()),
+        ("SELECT {num} AS {Q_name}", {"num", "Q_name"}),
+        ("SELECT {num!r:>10}, {num}", {"num"}),
+        ("SELECT {num} -- {{ ignore }}", {"num"}),
+        ("SELECT {num:{width}}", {"num"}),
+        ("SELECT '{{{num}}}', '{{x}}'", {"num"}),
+        ("SELECT {0}, {num.real}", {"0", "num.real"}),
+    ],
+)
+def test_parse_keys(s, keys):
+    assert parse_keys(s) == keys
+
+
+def test_no_keys():
+    assert Q("SELECT 42") == "SELECT 42"
+    assert Q("SELECT '{{}}'") == "SELECT '{}'"
+
+
+def test_ids_increase():
+    ids = [Q("SELECT 42").id for _ in range(100)]
+    assert ids == sorted(set(ids))
+
+
 def test_keys_missing():
     s = "SELECT {num} AS {Q_name}"
     with pytest.raises(QStringError, match="values missing for keys: {'Q_name'}"):
@@ -51,8 +81,29 @@ def test_from_file():
 def test_parse_error():
     q = Q("SELE 42")
     assert q.ast_errors
-    with pytest.raises(ParseError):
-        _ = Q("SELE 42", validate=True)
+    for _ in range(2):  # second time from the parse cache
+        with pytest.raises(ParseError) as e:
+            _ = Q("SELE 42", validate=True)
+        assert e.value.errors and e.value.errors[0]["line"] == 1
+
+
+def test_ast_parsed_lazily():
+    q = Q("SELE 42")
+    assert "ast" not in q.__dict__
+    assert q.ast_errors
+    assert "ast" not in q.__dict__
+    assert q.ast is None
+    assert Q("SELECT 42").ast.sql() == "SELECT 42"
+
+
+def test_run_and_save_do_not_parse():
+    from qstrings.Q import _cached_parse
+
+    q = Q("SELECT 4242 AS not_parsed", quiet=True)
+    before = _cached_parse.cache_info()
+    assert q.run().fetchall() == [(4242,)]
+    assert q.dict["ast_errors"] is None
+    assert _cached_parse.cache_info() == before
 
 
 def test_select_42_duckdb_ast_sqlglot_should_know_this():
@@ -79,6 +130,27 @@ def test_select_42_ast_patched_q():
     assert q1.ast == q2.ast
 
 
+def test_ast_parse_cache_not_shared():
+    q1 = Q("SELECT 42")
+    q2 = Q("SELECT 42")
+    assert q1.ast == q2.ast
+    assert q1.ast is not q2.ast
+    q1.ast.from_("table", copy=False)
+    assert q2.ast.sql() == "SELECT 42"
+    assert Q("SELECT 42").ast.sql() == "SELECT 42"
+
+
+def test_patched_q_when_qstrings_imported_first():
+    code = (
+        "from qstrings import Q\n"
+        "import sqlglot\n"
+        "q = sqlglot.parse_one('SELECT 1').q()\n"
+        "assert isinstance(q, Q) and q == 'SELECT 1'\n"
+    )
+    cwd = Path(__file__).parent.parent
+    subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True)
+
+
 def test_select_42_ast_limit():
     q = Q("SELECT 42")
     q_limit = q.limit(1)
@@ -104,6 +176,14 @@ def test_run_duckdb_error():
     result = q.run(engine="duckdb", quiet=True)
     assert 'syntax error at or near "THIS"' in str(result)
     assert q.rows == q.cols == 0
+    rows = Q("SELECT 'it''s' FROM no_such_table", quiet=True).list(quiet=True)
+    assert rows[0] == ("q", "r")
+    assert rows[1][0] == "SELECT 'it''s' FROM no_such_table"
+    # same fetch semantics as a DuckDB relation
+    rel = q.run(quiet=True)
+    assert len(rel.fetchmany(10)) == 1
+    assert rel.fetchmany(10) == rel.fetchall() == []
+    assert len(rel.fetchall()) == 1
 
 
 def test_run_duckdb():
@@ -119,6 +199,38 @@ def test_run_duckdb_used_to_fail_on_closed_connection():
     Q("SELECT 42 AS answer", quiet=True).run().fetchall() == [(42,)]
 
 
+def test_run_duckdb_iter_rows():
+    q = Q("SELECT range AS n FROM range(5)", quiet=True)
+    rows = q.iter_rows(batch_size=2, quiet=True)
+    assert list(rows) == [("n",), (0,), (1,), (2,), (3,), (4,)]
+
+
+def test_iter_rows_falls_back_to_list():
+    class ListOnlyEngine(Engine):
+        def list(q: Q, header=True):
+            return [("answer",), (42,)] if header else [(42,)]
+
+    q = Q("SELECT 42", quiet=True)
+    assert list(q.iter_rows(engine="ListOnly")) == [("answer",), (42,)]
+    assert list(q.iter_rows(engine="ListOnly", header=False)) == [(42,)]
+
+
+def test_run_duckdb_reuses_connection():
+    Q("SELECT 42", quiet=True).run()
+    con = Engine["duckdb"].con
+    Q("SELECT 42", quiet=True).run()
+    assert Engine["duckdb"].con is con
+
+
+def test_run_duckdb_memory_persists_until_close():
+    Q("CREATE TABLE persisted AS SELECT 42 AS answer", quiet=True).run()
+    assert Q("FROM persisted", quiet=True).list(header=False) == [(42,)]
+    Engine["duckdb"].close()
+    assert Engine["duckdb"].con is None
+    result = Q("FROM persisted", quiet=True).run(quiet=True)
+    assert "persisted does not exist" in str(result)
+
+
 def test_run_duckdb_connect_to_tmpdb():
     Q("SELECT 42 AS answer", quiet=True).run().fetchall() == [(42,)]
     tmpdb = Path(__file__).parent / "tmp.duckdb"
@@ -127,6 +239,12 @@ def test_run_duckdb_connect_to_tmpdb():
     assert result.fetchall() == [(42,)]
     assert q.list(header=False, quiet=True) == [(42,)]
     assert q.list(header=True, quiet=True) == [("answer",), (42,)]
+    # same file via a relative path, then reopened read-only
+    rel_tmpdb = os.path.relpath(tmpdb)
+    assert q.list(db=rel_tmpdb, header=False, quiet=True) == [(42,)]
+    assert q.list(db=tmpdb, read_only=True, header=False, quiet=True) == [(42,)]
+    assert list(Engine["duckdb"]._con_pool).count(str(tmpdb.resolve())) == 1
+    Engine["duckdb"].close(tmpdb)
     tmpdb.unlink(missing_ok=True)
 
 
@@ -142,6 +260,15 @@ def test_history_alias():
     assert q3 == "SELECT 42 AS blah"
 
 
+def test_history_after_read_only_history_query():
+    Q("SELECT 42 AS before_read_only", alias="before").run(quiet=True)
+    rows = Q("FROM q", quiet=True).list(db=Q.HISTORY, read_only=True, quiet=True)
+    assert ("q", "r") != rows[0]
+    q = Q("SELECT 42 AS after_read_only", alias="after")
+    assert q.run(quiet=True).fetchall() == [(42,)]
+    assert Q.from_history(alias="after") == "SELECT 42 AS after_read_only"
+
+
 def test_run_new_engine():
     class FunnyDuckDBEngine(Engine):
         def run(q: Q):
@@ -163,6 +290,72 @@ def test_run_new_engine():
         q.run(engine="NonExistentEngine")
 
 
+def test_redefined_engine_not_cached():
+    class EchoEngine(Engine):
+        def run(q: Q):
+            return "old"
+
+    q = Q("SELECT 42", quiet=True)
+    assert q.run(engine="echo") == "old"
+
+    class EchoEngine(Engine):  # noqa: F811
+        def run(q: Q):
+            return "new"
+
+    assert q.run(engine="echo") == "new"
+
+
+class StubStream:
+    """Stand-in for openai's Stream: iterable context manager."""
+
+    def __init__(self, events: list):
+        self.events = events
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+    def __iter__(self):
+        return iter(self.events)
+
+
+def run_hf_stub(q: Q, events: list) -> str:
+    """Run q on HFEngine with a stub client that streams `events`."""
+    stream = StubStream(events)
+    responses = SimpleNamespace(create=lambda **kwargs: stream)
+    hf = Engine["hf"]
+    hf._client, client = SimpleNamespace(responses=responses), hf._client
+    try:
+        return q.run(engine="hf", save=False)
+    finally:
+        hf._client = client
+        assert stream.closed
+
+
+def test_hf_engine_streamed_response():
+    response = SimpleNamespace(usage=SimpleNamespace(input_tokens=7, output_tokens=2))
+    events = [
+        SimpleNamespace(type="response.reasoning_text.delta", delta="hmm"),
+        SimpleNamespace(type="response.output_text.delta", delta="4"),
+        SimpleNamespace(type="response.output_text.delta", delta="2"),
+        SimpleNamespace(type="response.completed", response=response),
+    ]
+    q = Q("What is the answer?", quiet=True)
+    assert run_hf_stub(q, events) == "42"
+    assert (q.input_tokens, q.output_tokens) == (7, 2)
+
+    # a rerun must not fall back to the previous run's response
+    partial = [SimpleNamespace(type="response.output_text.delta", delta="4")]
+    with pytest.raises(QStringError, match="without a final response"):
+        run_hf_stub(q, partial)
+    error = SimpleNamespace(type="error", message="rate limited")
+    with pytest.raises(QStringError, match="HF stream error: rate limited"):
+        run_hf_stub(q, partial + [error])
+
+
 @pytest.mark.skipif(
     os.getenv("HF_API_KEY") is None,
     reason="HF_API_KEY not set",